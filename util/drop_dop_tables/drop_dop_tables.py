@@ -1,11 +1,11 @@
 """
-Script to drop tables from an RDS MySQL database while handling foreign key dependencies.
+Script to drop tables from an RDS MySQL database regardless of foreign key dependencies between them.
 
 Usage:
     python drop_dop_tables.py --db-host=my-db-host --db-name=my-db
 
 Arguments:
-    --db-host      The RDS database host.
+    --db-host      The RDS database host (or an RDS Proxy endpoint to reuse warm connections across runs).
     --db-name      The database name.
     --dry-run      Enable dry run mode (no actual changes).
 
@@ -15,8 +15,8 @@ Environment Variables:
 
 Functionality:
     - Drops specific tables only if they have had no activity in the last 12 months.
-    - Handles foreign key constraints before dropping dependent tables.
-    - Ensures safe execution using retries for AWS service interactions.
+    - Drops all tables in a single statement with foreign key checks disabled.
+    - Ensures safe execution using botocore standard retries for AWS service interactions.
 
 Example:
     export DB_USERNAME=admin
@@ -26,14 +26,14 @@ Example:
 
 import boto3
 import click
-import backoff
-from botocore.exceptions import ClientError
+from botocore.config import Config
 import pymysql
 import logging
-from datetime import datetime, timedelta
+import re
 
 
 MAX_TRIES = 5
+BOTO_CONFIG = Config(retries={'max_attempts': MAX_TRIES, 'mode': 'standard'})
 
 TABLES_TO_DROP = [
     "third_party_auth_providerapipermissions",  # FK reference to oauth2_client
@@ -47,15 +47,8 @@ TABLES_TO_DROP = [
     "oauth_provider_scope",  # Referenced by oauth_provider_token
     "oauth_provider_nonce",  # No known FK references
 ]
-FK_DEPENDENCIES = {
-    "third_party_auth_providerapipermissions": ["oauth2_client"],
-    "oauth2_provider_trustedclient": ["oauth2_client"],
-    "oauth2_grant": ["oauth2_client", "auth_user"],
-    "oauth2_accesstoken": ["oauth2_client", "auth_user"],
-    "oauth2_refreshtoken": ["oauth2_accesstoken", "oauth2_client", "auth_user"],
-    "oauth_provider_token": ["oauth_provider_consumer", "oauth_provider_scope", "auth_user"],
-    "oauth_provider_consumer": ["auth_user"],
-}
+# Table names are formatted directly into DDL, so only plain identifiers are accepted
+TABLE_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
 
 # Configure logging
 LOGGER = logging.getLogger(__name__)
@@ -65,95 +58,100 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 class EC2BotoWrapper:
     def __init__(self):
-        self.client = boto3.client("ec2")
+        self.client = boto3.client("ec2", config=BOTO_CONFIG)
 
-    @backoff.on_exception(backoff.expo, ClientError, max_tries=MAX_TRIES)
     def describe_regions(self):
         return self.client.describe_regions()
 
 
 class RDSBotoWrapper:
     def __init__(self, **kwargs):
+        kwargs.setdefault("config", BOTO_CONFIG)
         self.client = boto3.client("rds", **kwargs)
 
-    @backoff.on_exception(backoff.expo, ClientError, max_tries=MAX_TRIES)
     def describe_db_instances(self):
         return self.client.describe_db_instances()
 
 
+def quote_table_name(name):
+    """ Backtick-quote a table name for use in DDL, which cannot take query parameters """
+    if name not in TABLES_TO_DROP or not TABLE_NAME_RE.match(name):
+        raise ValueError(f"Refusing to use unexpected table name {name!r}")
+    return f"`{name}`"
+
+
 def connect_to_db(db_host, db_user, db_password, db_name):
-    """ Establish a connection to the RDS MySQL database """
+    """
+    Establish a connection to the RDS MySQL database.
+    pymysql leaves autocommit disabled, so the whole cleanup runs as one transaction committed by the caller.
+    Note that MySQL implicitly commits around DDL such as DROP TABLE, so this only groups the
+    metadata checks and any non-DDL statements.
+    Multi-statement queries are enabled so the drop sequence is sent in a single round-trip.
+    """
     logging.info("Connecting to the database...")
     return pymysql.connect(
         host=db_host,
         user=db_user,
         password=db_password,
         database=db_name,
-        cursorclass=pymysql.cursors.DictCursor
+        cursorclass=pymysql.cursors.DictCursor,
+        client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS
     )
 
 
-def drop_foreign_key(connection, db_name, table_name, referenced_table, dry_run):
+def get_recently_active_table(connection, db_name, table_names):
+    """ Return (table name, last activity date) for a table with activity in the last 12 months, if any """
     query = f"""
-    SELECT CONSTRAINT_NAME FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
-    WHERE TABLE_SCHEMA = '{db_name}' AND TABLE_NAME = '{table_name}' AND REFERENCED_TABLE_NAME = '{referenced_table}';
-    """
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        result = cursor.fetchone()
-        if result:
-            constraint_name = result["CONSTRAINT_NAME"]
-            drop_query = f"ALTER TABLE {table_name} DROP FOREIGN KEY {constraint_name};"
-            if dry_run:
-                logging.info(f"[Dry Run] Would drop foreign key {constraint_name} from {table_name}.")
-            else:
-                cursor.execute(drop_query)
-                connection.commit()
-                logging.info(f"Dropped foreign key {constraint_name} from {table_name}.")
-
-
-
-def get_last_activity_date(connection, table_name):
-    """ Retrieve the last activity date for a table """
-    query = f"""
-    SELECT MAX(GREATEST(
-        COALESCE(UPDATE_TIME, '1970-01-01 00:00:00'),
-        COALESCE(CREATE_TIME, '1970-01-01 00:00:00')
-    )) AS last_activity 
+    SELECT TABLE_NAME, GREATEST(
+        COALESCE(UPDATE_TIME, TIMESTAMP('1970-01-01 00:00:00')),
+        COALESCE(CREATE_TIME, TIMESTAMP('1970-01-01 00:00:00'))
+    ) AS last_activity 
     FROM information_schema.tables 
-    WHERE TABLE_NAME = '{table_name}';
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({', '.join(['%s'] * len(table_names))})
+    HAVING last_activity > (NOW() - INTERVAL 365 DAY)
+    LIMIT 1;
     """
     with connection.cursor() as cursor:
-        cursor.execute(query)
+        cursor.execute(query, [db_name] + list(table_names))
         result = cursor.fetchone()
-        if result and result["last_activity"]:
-            return datetime.strptime(str(result["last_activity"]), "%Y-%m-%d %H:%M:%S")
-        return None  # If no activity, return None
+        if result:
+            return result["TABLE_NAME"], result["last_activity"]
+        return None  # If no table is active, return None
 
 
-def check_all_tables_before_proceeding(connection):
+def check_all_tables_before_proceeding(connection, db_name):
     """ Check if any table has recent activity (within 12 months) """
-    one_year_ago = datetime.now() - timedelta(days=365)
+    active_table = get_recently_active_table(connection, db_name, TABLES_TO_DROP)
+    if active_table:
+        table, last_activity = active_table
+        logging.info("Skipping all operations: Table %s has recent activity on %s.", table, last_activity)
+        return False  # Stop execution if any table is active
 
-    for table in TABLES_TO_DROP:
-        last_activity = get_last_activity_date(connection, table)
-        if last_activity and last_activity > one_year_ago:
-            logging.info(f"Skipping all operations: Table {table} has recent activity on {last_activity}.")
-            return False  # Stop execution if any table is active
-
-    logging.info("All tables have no updates in the last 12 months. Proceeding with FK and table drops.")
+    logging.info("All tables have no updates in the last 12 months. Proceeding with table drops.")
     return True  # Continue execution if all tables are inactive
 
 
-def drop_table(connection, table_name, dry_run):
-    logging.info(f"Dropping table {table_name}...")
+def drop_all_tables(connection, dry_run):
+    """ Drop every table in TABLES_TO_DROP with one statement, bypassing foreign key checks """
+    table_list = ", ".join(quote_table_name(table) for table in TABLES_TO_DROP)
+    logging.info("Dropping tables %s...", ", ".join(TABLES_TO_DROP))
     if dry_run:
-        logging.info(f"[Dry Run] Would drop table {table_name}.")
-    else:
-        with connection.cursor() as cursor:
-            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-        connection.commit()
-        logging.info(f"Table {table_name} dropped.")
+        logging.info("[Dry Run] Would drop tables %s.", ", ".join(TABLES_TO_DROP))
+        return
+
+    # No per-table foreign key phase is needed, and DROP TABLE serializes on the data dictionary,
+    # so a single statement on one connection is faster than fanning drops out over a worker pool.
+    # The whole sequence goes out as one multi-statement query; FOREIGN_KEY_CHECKS is session
+    # scoped, so if the DROP fails it only affects this connection, which is closed afterwards.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SET FOREIGN_KEY_CHECKS=0; "
+            f"DROP TABLE IF EXISTS {table_list}; "
+            "SET FOREIGN_KEY_CHECKS=1;"
+        )
+        while cursor.nextset():
+            pass
+    logging.info("Tables dropped.")
 
 
 @click.command()
@@ -164,25 +162,29 @@ def drop_table(connection, table_name, dry_run):
 @click.option('--dry-run', is_flag=True, help="Enable dry run mode (no actual changes)")
 def drop_tables(db_host, db_user, db_password, db_name, dry_run):
     """
-    A script to drop tables from an RDS database while handling foreign key dependencies.
+    A script to drop tables from an RDS database regardless of foreign key dependencies.
     Table names are read from the provided file.
     """
+    connection = None
     try:
         connection = connect_to_db(db_host, db_user, db_password, db_name)
 
-        tables_activity = check_all_tables_before_proceeding(connection)
+        tables_activity = check_all_tables_before_proceeding(connection, db_name)
         if tables_activity:
-            for table, referenced_tables in FK_DEPENDENCIES.items():
-                for referenced_table in referenced_tables:
-                    drop_foreign_key(connection, db_name, table, referenced_table, dry_run)
-
-            for table in TABLES_TO_DROP:
-                drop_table(connection, table, dry_run)
+            drop_all_tables(connection, dry_run)
 
-            connection.close()
+            connection.commit()
             logging.info("Database cleanup completed successfully.")
     except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        logging.error("An error occurred: %s", e)
+        if connection and connection.open:
+            try:
+                connection.rollback()
+            except pymysql.err.Error as rollback_error:
+                logging.error("Rollback failed: %s", rollback_error)
+    finally:
+        if connection and connection.open:
+            connection.close()
 
 
 if __name__ == '__main__':
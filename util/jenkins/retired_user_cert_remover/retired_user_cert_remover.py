@@ -5,7 +5,7 @@ Usage:
     python retired_user_cert_remover.py --db-host=my-db-host --db-name=my-db --dry-run
 
 Arguments:
-    --db-host       The RDS database host.
+    --db-host       The RDS database host (or an RDS Proxy endpoint to reuse warm connections across runs).
     --db-name       The database name.
     --dry-run       Run the script in dry-run mode (logs actions without deleting).
     --db-user       The RDS database user (also settable via DB_USER env var).
@@ -28,83 +28,171 @@ Example:
 """
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import pymysql
-import backoff
 import click
 import sys
 import logging
+import queue
+import threading
+from contextlib import contextmanager
+from itertools import islice
 
 MAX_TRIES = 5
+# S3 DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+DELETE_WORKERS = 16
+# Batches waiting for a delete worker; bounds memory when S3 is slower than the database
+DELETE_QUEUE_SIZE = 10
 # Configure logging
 LOGGER = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+_S3_CLIENT = None
+
+
+def get_s3_client():
+    """ Return the shared S3 client, creating it on first use """
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT = boto3.client("s3", config=Config(
+            max_pool_connections=DELETE_WORKERS * 2,
+            retries={'max_attempts': MAX_TRIES, 'mode': 'standard'},
+            tcp_keepalive=True,
+        ))
+    return _S3_CLIENT
+
+
 class S3BotoWrapper:
     def __init__(self):
-        self.client = boto3.client("s3")
-
-    @backoff.on_exception(backoff.expo, ClientError, max_tries=MAX_TRIES)
-    def delete_object(self, bucket, key):
-        return self.client.delete_object(Bucket=bucket, Key=key)
+        self.client = get_s3_client()
+
+    def delete_objects(self, bucket, keys):
+        return self.client.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+
+
+@contextmanager
+def connect_to_db(db_host, db_user, db_password, db_name):
+    """ Open a streaming (unbuffered) dict-row connection that is closed when the block exits """
+    connection = pymysql.connect(
+        host=db_host,
+        user=db_user,
+        password=db_password,
+        database=db_name,
+        cursorclass=pymysql.cursors.SSDictCursor
+    )
+    try:
+        yield connection
+    finally:
+        connection.close()
 
 
 def fetch_certificates_to_delete(db_host, db_user, db_password, db_name):
+    """ Yield the S3 keys of each certificate row as they are streamed from the database """
     try:
-        connection = pymysql.connect(host=db_host, user=db_user, password=db_password, database=db_name)
-        cursor = connection.cursor()
-        logging.info("Running query on database...")
-        cursor.execute("""
-            SELECT 
-                au.id as "LMS_USER_ID",
-                gc.course_id as "COURSE_RUN_ID",
-                gc.id as "CERTIFICATE_ID",
-                gc.download_url as "CERTIFICATE_URL",
-                gc.download_uuid as "DOWNLOAD_UUID",
-                gc.verify_uuid as "VERIFY_UUID"
-            FROM 
-                auth_user as au
-            JOIN 
-                certificates_generatedcertificate as gc
-            ON 
-                gc.user_id = au.id
-            WHERE 
-                au.is_active = 0
-                AND gc.download_url LIKE '%%https://%%'
-                AND gc.status = 'downloadable'
-            ORDER BY 
-                LMS_USER_ID,
-                COURSE_RUN_ID;
-        """)
-        result = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        return result
+        with connect_to_db(db_host, db_user, db_password, db_name) as connection, connection.cursor() as cursor:
+            logging.info("Running query on database...")
+            # The prefix match on download_url can use an index range scan together with the status
+            # equality, e.g. CREATE INDEX idx_gc_status_url ON certificates_generatedcertificate(status, download_url(16))
+            cursor.execute("""
+                SELECT 
+                    CONCAT('cert/', gc.verify_uuid) as "VERIFY_KEY",
+                    CONCAT('downloads/', gc.download_uuid, '/Certificate.pdf') as "DOWNLOAD_KEY"
+                FROM 
+                    auth_user as au
+                JOIN 
+                    certificates_generatedcertificate as gc
+                ON 
+                    gc.user_id = au.id
+                WHERE 
+                    au.is_active = 0
+                    AND gc.download_url LIKE 'https://%%'
+                    AND gc.status = 'downloadable';
+            """)
+            yield from cursor
     except Exception as ex:
-        logging.error(f"Database query failed with error: {ex}")
+        logging.error("Database query failed with error: %s", ex)
         sys.exit(1)
 
 
+def batched(iterable, size):
+    """ Yield successive lists of at most `size` items from iterable """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def delete_batch(s3_client, batch):
+    """ Delete a batch of keys from S3, returning a list of (key, error message) failures """
+    logging.info("Deleting %d objects from S3...", len(batch))
+    try:
+        response = s3_client.delete_objects("verify.edx.org", batch)
+    except (BotoCoreError, ClientError) as e:
+        return [(key, str(e)) for key in batch]
+    return [
+        (error['Key'], f"{error['Code']} - {error['Message']}")
+        for error in response.get('Errors', [])
+    ]
+
+
+def certificate_keys(certificates):
+    """ Lazily produce a flat stream of the verify and download S3 keys for each certificate row """
+    return (key for cert in certificates for key in (cert['VERIFY_KEY'], cert['DOWNLOAD_KEY']))
+
+
+def delete_worker(s3_client, batches, errors):
+    """ Delete batches taken from the queue until the end-of-stream sentinel (None) is received """
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        errors.extend(delete_batch(s3_client, batch))
+
+
 def delete_certificates_from_s3(certificates, dry_run):
+    keys = certificate_keys(certificates)
+    if dry_run:
+        for batch in batched(keys, DELETE_BATCH_SIZE):
+            if LOGGER.isEnabledFor(logging.INFO):
+                for key in batch:
+                    logging.info("[Dry Run] Would delete %s from S3", key)
+        return
+
+    # Rows are streamed from the database on this thread while the workers delete
+    # earlier batches, so the fetch and the S3 deletions overlap.
     s3_client = S3BotoWrapper()
-    for cert in certificates:
-        verify_uuid = cert[5]       # VERIFY_UUID
-        download_uuid = cert[4]     # DOWNLOAD_UUID
-
-        verify_key = f"cert/{verify_uuid}"
-        download_key = f"downloads/{download_uuid}/Certificate.pdf"
-        try:
-            if dry_run:
-                logging.info(f"[Dry Run] Would delete {verify_key} from S3")
-                logging.info(f"[Dry Run] Would delete {download_key} from S3")
-            else:
-                logging.info(f"Deleting {verify_key} from S3...")
-                s3_client.delete_object("verify.edx.org", verify_key)
-                logging.info(f"Deleting {download_key} from S3...")
-                s3_client.delete_object("verify.edx.org", download_key)
-        except ClientError as e:
-            logging.error(f"Error deleting {verify_key} or {download_key}: {e}")
+    batches = queue.Queue(maxsize=DELETE_QUEUE_SIZE)
+    errors = []
+    workers = [
+        threading.Thread(target=delete_worker, args=(s3_client, batches, errors))
+        for _ in range(DELETE_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+
+    total = 0
+    try:
+        for batch in batched(keys, DELETE_BATCH_SIZE):
+            total += len(batch)
+            batches.put(batch)
+    finally:
+        for _ in workers:
+            batches.put(None)
+        for worker in workers:
+            worker.join()
+
+        # Report even when the database stream fails partway, since queued batches were still deleted
+        for key, message in errors:
+            logging.error("Error deleting %s: %s", key, message)
+        logging.info("Deleted %d of %d objects from S3.", total - len(errors), total)
 
 
 @click.command()